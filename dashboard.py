@@ -5,11 +5,35 @@ Shows: Live data, temperature control, energy savings, cycle analysis
 """
 
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import timedelta
+import os
+import tempfile
 import warnings
+from dataclasses import dataclass, field
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """Stand-in for numba.njit when numba is not installed."""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+try:
+    import pyarrow  # noqa: F401  (read_csv engine and Parquet support)
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+CSV_ENGINE = 'pyarrow' if PYARROW_AVAILABLE else 'c'
 
 warnings.filterwarnings('ignore')
 
@@ -64,123 +88,668 @@ st.markdown("""
 # DATA LOADING & PROCESSING
 # ============================================================================
 
+DATA_CSV = 'experiment_data.csv'
+# Typed, columnar copy of the CSV, written on first load and reused while it
+# is newer than the CSV
+DATA_PARQUET = 'experiment_data.parquet'
+
+# CSVs larger than this (multi-day logs) are summarized chunk by chunk
+# instead of being loaded whole
+LARGE_CSV_BYTES = 256 * 1024 * 1024
+CSV_CHUNK_ROWS = 100_000
+
+# Column types of experiment_data.csv, so the parser doesn't have to infer them.
+# Sensor readings carry ~3 significant digits, so float32 is plenty and halves
+# the memory every reduction and chart has to move.
+CSV_DTYPES = {
+    'current_amps': 'float32',
+    'temperature_celsius': 'float32',
+    'heater_state': 'category'
+}
+
+
+def _parquet_cache_is_fresh():
+    """Check whether the Parquet cache exists and is at least as new as the CSV."""
+    return (PYARROW_AVAILABLE and os.path.exists(DATA_PARQUET)
+            and os.path.getmtime(DATA_PARQUET) >= os.path.getmtime(DATA_CSV))
+
+
+def _write_parquet_cache(df):
+    """Write the Parquet cache atomically, so readers never see a partial file."""
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(DATA_PARQUET)), suffix='.parquet.tmp')
+        os.close(fd)
+        try:
+            df.to_parquet(tmp_path, compression='zstd', index=False)
+            os.replace(tmp_path, DATA_PARQUET)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except OSError:
+        pass  # Cache is optional (e.g. read-only directory)
+
+
+def _parse_timestamps(df):
+    """Convert the timestamp column in place to timezone-naive datetime64."""
+    # Create proper timestamp (if just integer, treat as seconds from start).
+    # The pyarrow engine already parses date strings while reading.
+    if pd.api.types.is_numeric_dtype(df['timestamp']):
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
+    elif not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+
+    # Timestamps with an offset are converted to UTC and stored without a
+    # timezone; otherwise to_numpy() would yield an object array of Timestamps
+    if isinstance(df['timestamp'].dtype, pd.DatetimeTZDtype):
+        df['timestamp'] = df['timestamp'].dt.tz_convert(None)
+
+    return df
+
+
+def _prepare_frame(df):
+    """Convert raw CSV columns in place: heater_state to 0/1, timestamp to datetime."""
+    # Convert heater_state from 'ON'/'OFF' to 1/0. Only the few distinct
+    # labels are upper-cased; rows are matched by their category code.
+    heater = df['heater_state'].cat
+    on_codes = np.flatnonzero(heater.categories.str.upper() == 'ON')
+    df['heater_state'] = np.isin(heater.codes, on_codes).astype(np.int8)
+
+    return _parse_timestamps(df)
+
+
 @st.cache_data
 def load_experiment_data():
-    """Load experiment data from CSV."""
+    """Load experiment data from the Parquet cache, or from CSV."""
     try:
-        df = pd.read_csv('experiment_data.csv')
+        if _parquet_cache_is_fresh():
+            try:
+                # Older caches may still hold timezone-aware timestamps
+                return _parse_timestamps(pd.read_parquet(DATA_PARQUET))
+            except (OSError, ValueError):
+                pass  # Unreadable cache (e.g. truncated); rebuild it from the CSV
+
+        df = _prepare_frame(pd.read_csv(DATA_CSV, engine=CSV_ENGINE, dtype=CSV_DTYPES))
 
-        # Convert heater_state from 'ON'/'OFF' to 1/0
-        df['heater_state'] = (df['heater_state'].str.upper() == 'ON').astype(int)
+        # Logs are written in time order, so sorting is normally a no-op
+        if not df['timestamp'].is_monotonic_increasing:
+            df = df.sort_values('timestamp', kind='mergesort').reset_index(drop=True)
 
-        # Create proper timestamp (if just integer, treat as seconds from start)
-        if df['timestamp'].dtype in ['int64', 'float64']:
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
-        else:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
+        if PYARROW_AVAILABLE:
+            _write_parquet_cache(df)
 
-        return df.sort_values('timestamp').reset_index(drop=True)
+        return df
     except FileNotFoundError:
         st.error("❌ experiment_data.csv not found!")
         st.info("Please save your Excel file as CSV: experiment_data.csv")
         return None
 
 
-def identify_heating_cycles(df):
-    """Identify and analyze heating cycles."""
-    cycles = []
+def _find_cycles_numpy(heater, power, current):
+    """Locate heating cycles with NumPy edge detection.
+
+    Returns (start_idx, end_idx, power_sum, max_current) arrays, one entry per
+    completed cycle.
+    """
+    # A cycle runs from the OFF->ON edge up to and including the first OFF
+    # sample; a cycle still running at the end of the data is not counted
+    n = len(heater)
+    edges = np.diff(heater, prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if ends.size and ends[-1] == n:
+        starts, ends = starts[:-1], ends[:-1]
+
+    if starts.size == 0:
+        return starts, ends, np.empty(0), np.empty(0)
+
+    # Interleaved breakpoints start_0, end_0 + 1, start_1, end_1 + 1, ...
+    # split the series into alternating ON cycles and OFF gaps, so one
+    # reduceat per statistic covers every cycle; keep the even segments.
+    # A cycle closed by the very last sample simply runs to the end.
+    breakpoints = np.empty(2 * starts.size, dtype=np.int64)
+    breakpoints[0::2] = starts
+    breakpoints[1::2] = ends + 1
+    if breakpoints[-1] == n:
+        breakpoints = breakpoints[:-1]
+
+    power_sum = np.add.reduceat(power, breakpoints)[::2]
+    max_current = np.fmax.reduceat(current, breakpoints)[::2]  # fmax skips NaN
+
+    return starts, ends, power_sum, max_current
+
+
+@njit(cache=True)
+def _cycles_loop(heater, power, current):
+    """Single-pass version of _find_cycles_numpy, compiled by numba."""
+    max_cycles = heater.shape[0] // 2 + 1
+    starts = np.empty(max_cycles, np.int64)
+    ends = np.empty(max_cycles, np.int64)
+    power_sum = np.empty(max_cycles, np.float64)
+    max_current = np.empty(max_cycles, np.float64)
+
+    count = 0
     in_cycle = False
-    cycle_start = None
-    energy_per_cycle = []
-
-    for idx, row in df.iterrows():
-        if row['heater_state'] == 1 and not in_cycle:
+    for i in range(heater.shape[0]):
+        if heater[i] != 0 and not in_cycle:
             in_cycle = True
-            cycle_start = idx
+            starts[count] = i
+            power_sum[count] = 0.0
+            max_current[count] = np.nan
 
-        elif row['heater_state'] == 0 and in_cycle:
-            in_cycle = False
-            start_time = df.loc[cycle_start, 'timestamp']
-            end_time = df.loc[idx, 'timestamp']
-            duration = (end_time - start_time).total_seconds() / 60
+        if in_cycle:
+            power_sum[count] += power[i]
+            # Blank current readings are skipped, like np.fmax
+            if current[i] > max_current[count] or np.isnan(max_current[count]):
+                max_current[count] = current[i]
 
-            # Calculate energy for this cycle
-            cycle_data = df.loc[cycle_start:idx]
-            cycle_energy = (cycle_data['power_watts'].sum() / 1000 / 60)  # Convert to kWh
+            if heater[i] == 0:
+                in_cycle = False
+                ends[count] = i
+                count += 1
 
-            cycles.append({
-                'number': len(cycles) + 1,
-                'start': start_time,
-                'end': end_time,
-                'duration_minutes': duration,
-                'energy_kwh': cycle_energy,
-                'avg_temp_start': df.loc[cycle_start, 'temperature_celsius'],
-                'avg_temp_end': df.loc[idx, 'temperature_celsius'],
-                'max_current': cycle_data['current_amps'].max()
-            })
-            energy_per_cycle.append(cycle_energy)
+    return starts[:count], ends[:count], power_sum[:count], max_current[:count]
 
-    return cycles, energy_per_cycle
 
+# Without numba, _cycles_loop would run as plain Python; use NumPy instead
+_find_cycles = _cycles_loop if NUMBA_AVAILABLE else _find_cycles_numpy
 
-def calculate_comprehensive_metrics(df):
-    """Calculate all energy and performance metrics."""
-    df = df.copy()
-
-    # Power calculation
-    df['power_watts'] = df['current_amps'] * 230  # Assuming 230V
-
-    # Total metrics
-    total_energy_wh = (df['power_watts'] / 60).sum()
-    total_energy_kwh = total_energy_wh / 1000
-
-    # Baseline (continuous heating)
-    heater_power_on = df[df['heater_state'] == 1]['power_watts'].mean()
-    total_minutes = len(df)
-    baseline_energy_kwh = (heater_power_on * total_minutes) / 60 / 1000
-
-    # Savings
-    saved_energy_kwh = baseline_energy_kwh - total_energy_kwh
-    savings_percent = (saved_energy_kwh / baseline_energy_kwh * 100) if baseline_energy_kwh > 0 else 0
-
-    # Cycles
-    cycles, energy_per_cycle = identify_heating_cycles(df)
-
-    # Temperature analysis
-    temp_mean = df['temperature_celsius'].mean()
-    temp_min = df['temperature_celsius'].min()
-    temp_max = df['temperature_celsius'].max()
-    temp_std = df['temperature_celsius'].std()
-    in_range = len(df[(df['temperature_celsius'] >= 32) & (df['temperature_celsius'] <= 37)])
-    in_range_percent = (in_range / len(df)) * 100
-
-    # Heater statistics
-    heater_on_time = len(df[df['heater_state'] == 1])
-    heater_on_percent = (heater_on_time / len(df)) * 100
-    avg_current = df['current_amps'].mean()
-    max_current = df['current_amps'].max()
 
+def identify_heating_cycles(heater, power, temperature, current, timestamps):
+    """Identify and analyze heating cycles from the per-sample arrays."""
+    starts, ends, power_sum, cycle_max_current = _find_cycles(heater, power, current)
+
+    cycle_energies = power_sum / (1000 * 60)  # Convert to kWh
+    durations = (timestamps[ends] - timestamps[starts]) / np.timedelta64(1, 'm')
+
+    # One array per column, so callers can build a DataFrame without copying
     return {
-        'total_energy_kwh': total_energy_kwh,
-        'baseline_energy_kwh': baseline_energy_kwh,
-        'saved_energy_kwh': saved_energy_kwh,
-        'savings_percent': savings_percent,
-        'cycles': cycles,
-        'num_cycles': len(cycles),
-        'avg_cycle_energy': sum(energy_per_cycle) / len(energy_per_cycle) if energy_per_cycle else 0,
-        'temp_mean': temp_mean,
-        'temp_min': temp_min,
-        'temp_max': temp_max,
-        'temp_std': temp_std,
-        'in_range_percent': in_range_percent,
-        'heater_on_percent': heater_on_percent,
-        'heater_on_time': heater_on_time,
-        'avg_current': avg_current,
-        'max_current': max_current,
-        'total_time_minutes': total_minutes,
-        'df': df
+        'number': np.arange(1, starts.size + 1),
+        'start': timestamps[starts],
+        'end': timestamps[ends],
+        'duration_minutes': durations,
+        'energy_kwh': cycle_energies,
+        'avg_temp_start': temperature[starts],
+        'avg_temp_end': temperature[ends],
+        'max_current': cycle_max_current
+    }
+
+
+def _temperature_stats_numpy(temperature, low, high):
+    """Return (count, mean, std, min, max, in_range_count) of the temperature series.
+
+    Blank (NaN) readings are skipped; count is the number of valid samples.
+    """
+    count = np.count_nonzero(~np.isnan(temperature))
+    in_range = np.count_nonzero((temperature >= low) & (temperature <= high))
+    if count == 0:
+        return 0, np.nan, np.nan, np.nan, np.nan, in_range
+    return (count, np.nanmean(temperature), np.nanstd(temperature, ddof=1),
+            np.nanmin(temperature), np.nanmax(temperature), in_range)
+
+
+@njit(cache=True)
+def _temperature_stats_loop(temperature, low, high):
+    """Single-pass version of _temperature_stats_numpy, compiled by numba."""
+    n = 0
+    # Sums are taken around the first valid sample to keep the variance stable
+    shift = 0.0
+    total = 0.0
+    total_sq = 0.0
+    t_min = np.inf
+    t_max = -np.inf
+    in_range = 0
+
+    for value in temperature:
+        if np.isnan(value):
+            continue
+        if n == 0:
+            shift = np.float64(value)
+        n += 1
+        delta = np.float64(value) - shift
+        total += delta
+        total_sq += delta * delta
+        t_min = min(t_min, value)
+        t_max = max(t_max, value)
+        if low <= value <= high:
+            in_range += 1
+
+    if n == 0:
+        return 0, np.nan, np.nan, np.nan, np.nan, in_range
+
+    mean = shift + total / n
+    std = np.nan
+    if n > 1:
+        std = np.sqrt(max(total_sq - total * total / n, 0.0) / (n - 1))
+
+    return n, mean, std, t_min, t_max, in_range
+
+
+# Without numba, _temperature_stats_loop would run as plain Python
+_temperature_stats = _temperature_stats_loop if NUMBA_AVAILABLE else _temperature_stats_numpy
+
+
+def _power_watts(current):
+    """Heater power per sample (230 V assumed); blank current readings count as 0 W."""
+    return np.where(np.isnan(current), 0.0, current * 230.0)
+
+
+def _frame_key(df):
+    """Cheap cache key for the experiment data: sample count and time span."""
+    return len(df), df['timestamp'].iloc[0].value, df['timestamp'].iloc[-1].value
+
+
+@dataclass
+class OnlineStats:
+    """Running experiment statistics, folded in one chunk of samples at a time.
+
+    Chunks must arrive in time order. Temperature mean and variance are
+    merged per chunk (Chan et al.), and a heating cycle still running at the
+    end of a chunk is carried over into the next one.
+    """
+    samples: int = 0
+    temp_samples: int = 0  # Samples with a temperature reading
+    temp_mean: float = 0.0
+    temp_m2: float = 0.0  # Sum of squared deviations from the mean
+    temp_min: float = np.inf
+    temp_max: float = -np.inf
+    in_range: int = 0
+    power_sum: float = 0.0
+    heater_on: int = 0
+    heater_power_sum: float = 0.0
+    heater_power_samples: int = 0  # Heater-on samples with a current reading
+    current_sum: float = 0.0
+    current_samples: int = 0  # Samples with a current reading
+    current_max: float = -np.inf
+    open_cycle: pd.DataFrame = None  # Rows of the cycle left open by the last chunk
+    cycle_chunks: list = field(default_factory=list)
+
+    def update(self, chunk):
+        """Fold one chunk of prepared samples into the running statistics."""
+        temperature = chunk['temperature_celsius'].to_numpy()
+        current = chunk['current_amps'].to_numpy()
+        heater = chunk['heater_state'].to_numpy(dtype=np.int8)
+        power = _power_watts(current)
+        self.samples += len(chunk)
+
+        # Temperature analysis (blank readings are skipped, as pandas would)
+        n, mean, std, t_min, t_max, in_range = _temperature_stats(temperature, 32.0, 37.0)
+        if n:
+            m2 = float(std) ** 2 * (n - 1) if n > 1 else 0.0
+            total = self.temp_samples + n
+            delta = float(mean) - self.temp_mean
+            self.temp_mean += delta * n / total
+            self.temp_m2 += m2 + delta * delta * self.temp_samples * n / total
+            self.temp_samples = total
+            self.temp_min = min(self.temp_min, float(t_min))
+            self.temp_max = max(self.temp_max, float(t_max))
+        self.in_range += int(in_range)
+
+        # Energy and heater statistics
+        has_current = ~np.isnan(current)
+        valid_current = int(np.count_nonzero(has_current))
+        self.power_sum += float(power.sum())
+        self.heater_on += int(np.count_nonzero(heater))
+        self.heater_power_sum += float(np.dot(heater, power))
+        self.heater_power_samples += int(np.count_nonzero(heater[has_current]))
+        self.current_sum += float(np.nansum(current))
+        if valid_current:
+            self.current_samples += valid_current
+            self.current_max = max(self.current_max, float(np.nanmax(current)))
+
+        # Cycles, including one that started in the previous chunk
+        if self.open_cycle is not None:
+            chunk = pd.concat([self.open_cycle, chunk], ignore_index=True)
+            temperature = chunk['temperature_celsius'].to_numpy()
+            current = chunk['current_amps'].to_numpy()
+            heater = chunk['heater_state'].to_numpy(dtype=np.int8)
+            power = _power_watts(current)
+
+        self.cycle_chunks.append(identify_heating_cycles(
+            heater, power, temperature, current, chunk['timestamp'].to_numpy()))
+
+        self.open_cycle = None
+        if heater[-1]:
+            off = np.flatnonzero(heater == 0)
+            self.open_cycle = chunk.iloc[off[-1] + 1 if off.size else 0:]
+
+    def finalize(self):
+        """Calculate all energy and performance metrics from the totals."""
+        samples = self.samples
+
+        # Total metrics
+        total_energy_wh = self.power_sum / 60
+        total_energy_kwh = total_energy_wh / 1000
+
+        # Baseline (continuous heating)
+        heater_power_on = (self.heater_power_sum / self.heater_power_samples
+                           if self.heater_power_samples else np.nan)
+        total_minutes = samples
+        baseline_energy_kwh = (heater_power_on * total_minutes) / 60 / 1000
+
+        # Savings
+        saved_energy_kwh = baseline_energy_kwh - total_energy_kwh
+        savings_percent = (saved_energy_kwh / baseline_energy_kwh * 100) if baseline_energy_kwh > 0 else 0
+
+        # Cycles (a cycle still open at the end of the data is not counted)
+        cycles = {
+            key: np.concatenate([chunk_cycles[key] for chunk_cycles in self.cycle_chunks])
+            for key in self.cycle_chunks[0]
+        }
+        num_cycles = len(cycles['number'])
+        cycles['number'] = np.arange(1, num_cycles + 1)
+
+        # Temperature analysis
+        temp_samples = self.temp_samples
+        temp_std = np.sqrt(self.temp_m2 / (temp_samples - 1)) if temp_samples > 1 else np.nan
+        in_range_percent = (self.in_range / samples) * 100
+
+        # Heater statistics
+        heater_on_percent = (self.heater_on / samples) * 100
+
+        return {
+            'total_energy_kwh': total_energy_kwh,
+            'baseline_energy_kwh': baseline_energy_kwh,
+            'saved_energy_kwh': saved_energy_kwh,
+            'savings_percent': savings_percent,
+            'cycles': cycles,
+            'num_cycles': num_cycles,
+            'avg_cycle_energy': float(cycles['energy_kwh'].mean()) if num_cycles else 0.0,
+            'temp_mean': self.temp_mean if temp_samples else np.nan,
+            'temp_min': self.temp_min if temp_samples else np.nan,
+            'temp_max': self.temp_max if temp_samples else np.nan,
+            'temp_std': temp_std,
+            'in_range_percent': in_range_percent,
+            'heater_on_percent': heater_on_percent,
+            'heater_on_time': self.heater_on,
+            'avg_current': self.current_sum / self.current_samples if self.current_samples else np.nan,
+            'max_current': self.current_max if self.current_samples else np.nan,
+            'total_time_minutes': total_minutes
+        }
+
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _frame_key})
+def calculate_comprehensive_metrics(df):
+    """Calculate all energy and performance metrics (the whole frame as one chunk)."""
+    stats = OnlineStats()
+    stats.update(df)
+    return stats.finalize()
+
+
+@st.cache_data(show_spinner=False)
+def summarize_large_experiment():
+    """Stream a CSV too large to load whole.
+
+    Returns the metrics and a reduced frame for the charts, made of the M4
+    points of temperature and current from every chunk. The CSV must be in
+    time order.
+    """
+    stats = OnlineStats()
+    plot_chunks = []
+
+    # The pyarrow engine has no chunked reader, so this uses the C parser
+    for chunk in pd.read_csv(DATA_CSV, dtype=CSV_DTYPES, chunksize=CSV_CHUNK_ROWS):
+        chunk = _prepare_frame(chunk)
+        stats.update(chunk)
+        keep = np.union1d(m4(chunk['temperature_celsius'].to_numpy(), MAX_PLOT_POINTS),
+                          m4(chunk['current_amps'].to_numpy(), MAX_PLOT_POINTS))
+        plot_chunks.append(chunk.iloc[keep])
+
+    return stats.finalize(), pd.concat(plot_chunks, ignore_index=True)
+
+
+# ============================================================================
+# FIGURES
+# ============================================================================
+
+# Time-series traces are reduced to about twice the pixel width of a
+# full-width chart before they are sent to the browser
+MAX_PLOT_POINTS = 2000
+
+# The bar charts are summaries; rendering them static skips plotly.js's
+# hover layer and event handlers
+STATIC_CHART_CONFIG = {'staticPlot': True, 'displayModeBar': False}
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the indices of (at most) n_out points of y that preserve the
+    visual shape of the line. x must be numeric and increasing.
+    """
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+
+    x = x - x[0]
+    # Bucket edges for the n_out - 2 inner buckets; the first and last
+    # points are always kept
+    edges = np.append(np.linspace(1, n - 1, n_out - 1).astype(np.int64), n)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_x = x[stop:edges[i + 2]].mean()
+        next_y = y[stop:edges[i + 2]].mean()
+
+        # Pick the point forming the largest triangle with the previously
+        # selected point and the average of the next bucket
+        area = np.abs((x[a] - next_x) * (y[start:stop] - y[a])
+                      - (x[a] - x[start:stop]) * (next_y - y[a]))
+        a = start + area.argmax()
+        indices[i + 1] = a
+
+    return indices
+
+
+def m4(y, n_out):
+    """M4 downsampling: first, last, min and max point of each bucket.
+
+    Returns sorted indices of at most n_out points. Keeps the envelope of
+    the series intact, which matters for filled area traces.
+    """
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+
+    buckets = np.arange(n) * (n_out // 4) // n
+    starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+    ends = np.append(starts[1:], n) - 1
+
+    # Blank (NaN) readings sort first in each bucket, so the maximum is still
+    # the last entry and the minimum is the first valid one
+    blank = np.isnan(y)
+    by_value = np.lexsort((np.where(blank, -np.inf, y), buckets))
+    first_valid = np.minimum(starts + np.add.reduceat(blank, starts, dtype=np.int64), ends)
+
+    return np.unique(np.concatenate((starts, ends, by_value[first_valid], by_value[ends])))
+
+
+def build_temperature_fig(df):
+    """Temperature trace with the 32-37°C target band."""
+    timestamps = df['timestamp'].to_numpy()
+    temperature = df['temperature_celsius'].to_numpy()
+    keep = lttb(pd.DatetimeIndex(timestamps).asi8.astype(np.float64), temperature, MAX_PLOT_POINTS)
+
+    fig = go.Figure()
+
+    # Temperature (straight WebGL segments; a spline would make plotly.js
+    # compute control points for every sample on the client)
+    fig.add_trace(
+        go.Scattergl(
+            x=timestamps[keep],
+            y=temperature[keep],
+            name='Temperature (°C)',
+            line=dict(color='#0066cc', width=3),
+            mode='lines',
+            hovertemplate='<b>Temperature</b><br>%{y:.2f}°C<br>%{x|%H:%M:%S}<extra></extra>'
+        )
+    )
+
+    # Target range (32–37°C) - shaded background
+    fig.add_hrect(
+        y0=32, y1=37,
+        fillcolor='rgba(0, 200, 0, 0.1)',
+        layer="below",
+        line_width=0
+    )
+
+    # Setpoint lines
+    fig.add_hline(y=32, line_dash="dash", line_color="red", annotation_text="Lower (32°C)", annotation_position="right")
+    fig.add_hline(y=37, line_dash="dash", line_color="orange", annotation_text="Upper (37°C)", annotation_position="right")
+
+    fig.update_xaxes(title_text="Time (HH:MM:SS)")
+    fig.update_yaxes(title_text="Temperature (°C)", range=[28, 42])
+
+    fig.update_layout(
+        title_text="Temperature Control in Mesophilic Range (32-37°C)",
+        hovermode='x unified',
+        height=450,
+        legend=dict(x=0.01, y=0.99),
+        showlegend=True
+    )
+
+    return fig
+
+
+def build_energy_fig(baseline_energy_kwh, total_energy_kwh, saved_energy_kwh):
+    """Baseline vs. actual vs. saved energy bar chart."""
+    categories = ['Baseline\n(Continuous)', 'Actual\n(Smart Control)', 'Saved']
+    values = [baseline_energy_kwh, total_energy_kwh, saved_energy_kwh]
+    colors = ['#ff6b6b', '#4dabf7', '#51cf66']
+
+    fig = go.Figure(
+        data=go.Bar(
+            x=categories,
+            y=values,
+            text=[f'{v:.4f}<br>kWh' for v in values],
+            textposition='outside',
+            marker=dict(color=colors),
+            hovertemplate='<b>%{x}</b><br>%{y:.4f} kWh<extra></extra>'
+        )
+    )
+
+    fig.update_layout(
+        title="Energy Consumption Comparison",
+        yaxis_title="Energy (kWh)",
+        showlegend=False,
+        height=400
+    )
+
+    return fig
+
+
+def build_current_fig(df):
+    """Current draw over time as a filled area."""
+    current = df['current_amps'].to_numpy()
+    keep = m4(current, MAX_PLOT_POINTS)
+
+    fig = go.Figure()
+
+    fig.add_trace(go.Scattergl(
+        x=df['timestamp'].to_numpy()[keep],
+        y=current[keep],
+        fill='tozeroy',
+        name='Current (A)',
+        line=dict(color='#9467bd', width=2),
+        fillcolor='rgba(148, 103, 189, 0.2)',
+        hovertemplate='<b>Current</b><br>%{y:.2f} A<br>%{x|%H:%M:%S}<extra></extra>'
+    ))
+
+    fig.update_layout(
+        title="Current Draw Over Time",
+        xaxis_title="Time",
+        yaxis_title="Current (A)",
+        height=400,
+        hovermode='x unified'
+    )
+
+    return fig
+
+
+def build_cycle_duration_fig(cycles):
+    """Duration of each heating cycle."""
+    cycle_numbers = cycles['number']
+    cycle_durations = cycles['duration_minutes']
+
+    fig = go.Figure(
+        data=go.Bar(
+            x=[f"Cycle {n}" for n in cycle_numbers],
+            y=cycle_durations,
+            marker_color='#2ca02c',
+            text=[f'{d:.1f} min' for d in cycle_durations],
+            textposition='outside',
+            hovertemplate='<b>%{x}</b><br>Duration: %{y:.1f} min<extra></extra>'
+        )
+    )
+
+    fig.update_layout(
+        title="Duration of Each Heating Cycle",
+        yaxis_title="Duration (minutes)",
+        showlegend=False,
+        height=400
+    )
+
+    return fig
+
+
+def build_cycle_energy_fig(cycles):
+    """Energy consumed by each heating cycle."""
+    cycle_numbers = cycles['number']
+    cycle_energies = cycles['energy_kwh']
+
+    fig = go.Figure(
+        data=go.Bar(
+            x=[f"Cycle {n}" for n in cycle_numbers],
+            y=cycle_energies,
+            marker_color='#ff7f0e',
+            text=[f'{e:.5f} kWh' for e in cycle_energies],
+            textposition='outside',
+            hovertemplate='<b>%{x}</b><br>Energy: %{y:.5f} kWh<extra></extra>'
+        )
+    )
+
+    fig.update_layout(
+        title="Energy Consumption Per Cycle",
+        yaxis_title="Energy (kWh)",
+        showlegend=False,
+        height=400
+    )
+
+    return fig
+
+
+@st.cache_resource(show_spinner=False, hash_funcs={pd.DataFrame: _frame_key})
+def build_figures(df, _metrics):
+    """Build every dashboard figure once per dataset, keyed by section.
+
+    Figures are shared across reruns and sessions, so a rerun only looks
+    them up instead of rebuilding and re-serializing the traces.
+    """
+    # The metrics are derived from df, so they are left out of the cache key
+    metrics = _metrics
+
+    figures = {
+        'temp': build_temperature_fig(df),
+        'energy': build_energy_fig(
+            metrics['baseline_energy_kwh'],
+            metrics['total_energy_kwh'],
+            metrics['saved_energy_kwh']
+        ),
+        'current': build_current_fig(df),
+        'cycles': None,
+        'cycle_energy': None
     }
 
+    if metrics['num_cycles']:
+        figures['cycles'] = build_cycle_duration_fig(metrics['cycles'])
+        figures['cycle_energy'] = build_cycle_energy_fig(metrics['cycles'])
+
+    return figures
+
 
 # ============================================================================
 # STREAMLIT LAYOUT
@@ -194,14 +763,17 @@ def main():
         unsafe_allow_html=True)
     st.markdown("---")
 
-    # Load data
-    df = load_experiment_data()
-    if df is None or df.empty:
-        st.stop()
+    # Load data and calculate metrics; logs too large to hold in memory are
+    # summarized chunk by chunk and plotted from a reduced frame
+    if os.path.exists(DATA_CSV) and os.path.getsize(DATA_CSV) > LARGE_CSV_BYTES:
+        metrics, df = summarize_large_experiment()
+    else:
+        df = load_experiment_data()
+        if df is None or df.empty:
+            st.stop()
+        metrics = calculate_comprehensive_metrics(df)
 
-    # Calculate metrics
-    metrics = calculate_comprehensive_metrics(df)
-    df_experiment = metrics['df']
+    figures = build_figures(df, metrics)
 
     # Get time range
     start_time = df['timestamp'].min()
@@ -281,44 +853,7 @@ def main():
 
     st.markdown("<div class='section-header'>📈 Temperature Control</div>", unsafe_allow_html=True)
 
-    fig_combined = go.Figure()
-
-    # Temperature (smooth line)
-    fig_combined.add_trace(
-        go.Scatter(
-            x=df_experiment['timestamp'],
-            y=df_experiment['temperature_celsius'],
-            name='Temperature (°C)',
-            line=dict(color='#0066cc', width=3, shape='spline'),
-            mode='lines',
-            hovertemplate='<b>Temperature</b><br>%{y:.2f}°C<br>%{x|%H:%M:%S}<extra></extra>'
-        )
-    )
-
-    # Target range (32–37°C) - shaded background
-    fig_combined.add_hrect(
-        y0=32, y1=37,
-        fillcolor='rgba(0, 200, 0, 0.1)',
-        layer="below",
-        line_width=0
-    )
-
-    # Setpoint lines
-    fig_combined.add_hline(y=32, line_dash="dash", line_color="red", annotation_text="Lower (32°C)", annotation_position="right")
-    fig_combined.add_hline(y=37, line_dash="dash", line_color="orange", annotation_text="Upper (37°C)", annotation_position="right")
-
-    fig_combined.update_xaxes(title_text="Time (HH:MM:SS)")
-    fig_combined.update_yaxes(title_text="Temperature (°C)", range=[28, 42])
-
-    fig_combined.update_layout(
-        title_text="Temperature Control in Mesophilic Range (32-37°C)",
-        hovermode='x unified',
-        height=450,
-        legend=dict(x=0.01, y=0.99),
-        showlegend=True
-    )
-
-    st.plotly_chart(fig_combined, use_container_width=True)
+    st.plotly_chart(figures['temp'], use_container_width=True)
 
     st.markdown("---")
 
@@ -332,57 +867,11 @@ def main():
 
     with col1:
         # Energy comparison bar chart
-        categories = ['Baseline\n(Continuous)', 'Actual\n(Smart Control)', 'Saved']
-        values = [
-            metrics['baseline_energy_kwh'],
-            metrics['total_energy_kwh'],
-            metrics['saved_energy_kwh']
-        ]
-        colors = ['#ff6b6b', '#4dabf7', '#51cf66']
-
-        fig_energy = go.Figure(
-            data=go.Bar(
-                x=categories,
-                y=values,
-                text=[f'{v:.4f}<br>kWh' for v in values],
-                textposition='outside',
-                marker=dict(color=colors),
-                hovertemplate='<b>%{x}</b><br>%{y:.4f} kWh<extra></extra>'
-            )
-        )
-
-        fig_energy.update_layout(
-            title="Energy Consumption Comparison",
-            yaxis_title="Energy (kWh)",
-            showlegend=False,
-            height=400
-        )
-
-        st.plotly_chart(fig_energy, use_container_width=True)
+        st.plotly_chart(figures['energy'], use_container_width=True, config=STATIC_CHART_CONFIG)
 
     with col2:
         # Current/Power over time
-        fig_current = go.Figure()
-
-        fig_current.add_trace(go.Scatter(
-            x=df_experiment['timestamp'],
-            y=df_experiment['current_amps'],
-            fill='tozeroy',
-            name='Current (A)',
-            line=dict(color='#9467bd', width=2),
-            fillcolor='rgba(148, 103, 189, 0.2)',
-            hovertemplate='<b>Current</b><br>%{y:.2f} A<br>%{x|%H:%M:%S}<extra></extra>'
-        ))
-
-        fig_current.update_layout(
-            title="Current Draw Over Time",
-            xaxis_title="Time",
-            yaxis_title="Current (A)",
-            height=400,
-            hovermode='x unified'
-        )
-
-        st.plotly_chart(fig_current, use_container_width=True)
+        st.plotly_chart(figures['current'], use_container_width=True)
 
     st.markdown("---")
 
@@ -396,70 +885,28 @@ def main():
 
     with col1:
         # Cycle duration bar chart
-        if metrics['cycles']:
-            cycle_numbers = [c['number'] for c in metrics['cycles']]
-            cycle_durations = [c['duration_minutes'] for c in metrics['cycles']]
-
-            fig_cycles = go.Figure(
-                data=go.Bar(
-                    x=[f"Cycle {n}" for n in cycle_numbers],
-                    y=cycle_durations,
-                    marker_color='#2ca02c',
-                    text=[f'{d:.1f} min' for d in cycle_durations],
-                    textposition='outside',
-                    hovertemplate='<b>%{x}</b><br>Duration: %{y:.1f} min<extra></extra>'
-                )
-            )
-
-            fig_cycles.update_layout(
-                title="Duration of Each Heating Cycle",
-                yaxis_title="Duration (minutes)",
-                showlegend=False,
-                height=400
-            )
-
-            st.plotly_chart(fig_cycles, use_container_width=True)
+        if metrics['num_cycles']:
+            st.plotly_chart(figures['cycles'], use_container_width=True, config=STATIC_CHART_CONFIG)
 
     with col2:
         # Cycle energy consumption
-        if metrics['cycles']:
-            cycle_numbers = [c['number'] for c in metrics['cycles']]
-            cycle_energies = [c['energy_kwh'] for c in metrics['cycles']]
-
-            fig_cycle_energy = go.Figure(
-                data=go.Bar(
-                    x=[f"Cycle {n}" for n in cycle_numbers],
-                    y=cycle_energies,
-                    marker_color='#ff7f0e',
-                    text=[f'{e:.5f} kWh' for e in cycle_energies],
-                    textposition='outside',
-                    hovertemplate='<b>%{x}</b><br>Energy: %{y:.5f} kWh<extra></extra>'
-                )
-            )
-
-            fig_cycle_energy.update_layout(
-                title="Energy Consumption Per Cycle",
-                yaxis_title="Energy (kWh)",
-                showlegend=False,
-                height=400
-            )
-
-            st.plotly_chart(fig_cycle_energy, use_container_width=True)
+        if metrics['num_cycles']:
+            st.plotly_chart(figures['cycle_energy'], use_container_width=True, config=STATIC_CHART_CONFIG)
 
     # Cycles detailed table
     st.subheader("📋 Detailed Cycle Breakdown")
-    if metrics['cycles']:
-        cycles_df = pd.DataFrame(metrics['cycles'])
-        cycles_df = cycles_df[[
-            'number', 'start', 'end', 'duration_minutes', 'energy_kwh',
-            'avg_temp_start', 'avg_temp_end', 'max_current'
-        ]].copy()
-
-        cycles_df.columns = ['Cycle', 'Start Time', 'End Time', 'Duration (min)', 'Energy (kWh)',
-                             'Start Temp (°C)', 'End Temp (°C)', 'Max Current (A)']
-
-        cycles_df['Start Time'] = cycles_df['Start Time'].dt.strftime('%H:%M:%S')
-        cycles_df['End Time'] = cycles_df['End Time'].dt.strftime('%H:%M:%S')
+    if metrics['num_cycles']:
+        cycles = metrics['cycles']
+        cycles_df = pd.DataFrame({
+            'Cycle': cycles['number'],
+            'Start Time': pd.DatetimeIndex(cycles['start']).strftime('%H:%M:%S'),
+            'End Time': pd.DatetimeIndex(cycles['end']).strftime('%H:%M:%S'),
+            'Duration (min)': cycles['duration_minutes'],
+            'Energy (kWh)': cycles['energy_kwh'],
+            'Start Temp (°C)': cycles['avg_temp_start'],
+            'End Temp (°C)': cycles['avg_temp_end'],
+            'Max Current (A)': cycles['max_current']
+        })
 
         st.dataframe(cycles_df, use_container_width=True, hide_index=True)
 
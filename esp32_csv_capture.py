@@ -5,19 +5,37 @@ from datetime import datetime
 import sys
 import time
 import argparse
+import re
+import shutil
+import tempfile
 
-def find_esp32_port():
-    """Try to find ESP32 port automatically"""
-    ports = serial.tools.list_ports.comports()
-    esp32_ports = []
+# A clean data row: five non-empty fields with no surrounding whitespace.
+# These need no fixing, so they are copied through as-is.
+CLEAN_ROW_RE = re.compile(r'[^,\s]+(?:,[^,\s]+){4}')
+
+# Port descriptions that commonly belong to an ESP32 / USB-serial bridge
+ESP32_PORT_RE = re.compile(r'ESP32|CH340|CP210|FTDI|USB|SERIAL', re.IGNORECASE)
+
+# Strings int() / float() would accept, so fields can be classified without
+# raising and catching ValueError (digit runs may contain single underscores)
+_DIGITS = r'\d(?:_?\d)*'
+INT_RE = re.compile(rf'[+-]?{_DIGITS}')
+FLOAT_RE = re.compile(
+    rf'[+-]?(?:(?:{_DIGITS}(?:\.(?:{_DIGITS})?)?|\.{_DIGITS})(?:[eE][+-]?{_DIGITS})?'
+    r'|(?i:inf|infinity|nan))'
+)
+
+def find_esp32_port(ports=None):
+    """Try to find ESP32 port automatically (pass `ports` to reuse an existing scan)"""
+    if ports is None:
+        ports = serial.tools.list_ports.comports()
     
     for port in ports:
-        # Common ESP32 identifiers
-        desc_upper = port.description.upper()
-        if any(keyword in desc_upper for keyword in ['ESP32', 'CH340', 'CP210', 'FTDI', 'USB', 'SERIAL']):
-            esp32_ports.append(port.device)
+        # Common ESP32 identifiers; the first match is the suggestion
+        if ESP32_PORT_RE.search(port.description):
+            return port.device
     
-    return esp32_ports
+    return None
 
 def get_desktop_path():
     """Get Desktop path for current user"""
@@ -39,44 +57,63 @@ def fix_csv_file(filepath):
         print(f"❌ File not found: {filepath}")
         return
     
-    # Read original file
-    fixed_lines = []
+    backup_path = filepath + '.backup'
+    
+    total_lines = 0
     skipped_lines = 0
     fixed_count = 0
     
-    with open(filepath, 'r', encoding='utf-8') as f:
-        for line_num, line in enumerate(f, 1):
-            line = line.strip()
-            if not line:
-                continue
-            
-            columns = [col.strip() for col in line.split(',') if col.strip()]
-            
-            if len(columns) == 5:
-                fixed_lines.append(','.join(columns))
-            else:
-                fixed = fix_csv_line(line, columns)
-                if fixed:
-                    fixed_lines.append(fixed)
-                    fixed_count += 1
-                else:
-                    skipped_lines += 1
-                    if skipped_lines <= 10:
-                        print(f"⚠ Line {line_num}: Skipped (can't fix): {line[:60]}")
+    # Stream fixed rows into a temp file next to the original, so a crash
+    # part-way through never leaves a half-written file under either name.
+    # The input is opened first, so an unreadable path fails before any temp file exists.
+    with open(filepath, 'r', buffering=1 << 20, encoding='utf-8') as fin:
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filepath)), suffix='.tmp')
+        try:
+            with os.fdopen(tmp_fd, 'w', buffering=1 << 20, newline='', encoding='utf-8') as fout:
+                for line_num, line in enumerate(fin, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    
+                    # Fast path: well-formed rows (the vast majority) are kept as-is
+                    if CLEAN_ROW_RE.fullmatch(line):
+                        fout.write(line + '\n')
+                        total_lines += 1
+                        continue
+                    
+                    columns = [col.strip() for col in line.split(',') if col.strip()]
+                    
+                    if len(columns) == 5:
+                        fout.write(','.join(columns) + '\n')
+                        total_lines += 1
+                    else:
+                        fixed = fix_csv_line(line, columns)
+                        if fixed:
+                            fout.write(fixed + '\n')
+                            total_lines += 1
+                            fixed_count += 1
+                        else:
+                            skipped_lines += 1
+                            if skipped_lines <= 10:
+                                print(f"⚠ Line {line_num}: Skipped (can't fix): {line[:60]}")
+                
+                # Make sure the fixed rows are on disk before swapping files
+                fout.flush()
+                os.fsync(fout.fileno())
+            shutil.copymode(filepath, tmp_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
     
-    # Write fixed file
-    backup_path = filepath + '.backup'
-    os.rename(filepath, backup_path)
+    # Keep the original as the backup, then move the fixed file into place
+    os.replace(filepath, backup_path)
+    os.replace(tmp_path, filepath)
     print(f"✓ Original file backed up to: {backup_path}")
     
-    with open(filepath, 'w', newline='', encoding='utf-8') as f:
-        for line in fixed_lines:
-            f.write(line + '\n')
-    
     print(f"\n✅ Fixed file saved!")
     print(f"   Original: {backup_path}")
     print(f"   Fixed: {filepath}")
-    print(f"   Total lines: {len(fixed_lines)}")
+    print(f"   Total lines: {total_lines}")
     print(f"   Fixed: {fixed_count}")
     print(f"   Skipped: {skipped_lines}")
     print("=" * 70)
@@ -87,57 +124,50 @@ def fix_csv_line(line, columns):
     - Missing timestamp (add placeholder or estimate)
     - Column misalignment
     - Missing values
+    
+    `columns` must already be stripped, with empty columns removed.
     """
     # Expected format: Timestamp(ms),Time(s),Current(A),Temperature(C),Heater_State
     # Expected: 5 columns
     
-    # Remove empty columns
-    columns = [col.strip() for col in columns if col.strip()]
-    
     if len(columns) == 5:
         # Perfect line, return as is
         return ','.join(columns)
     elif len(columns) == 4:
         # Missing one column - likely missing timestamp
         # Check if first column looks like a timestamp (large number)
-        try:
-            first_val = int(columns[0])
-            if first_val < 1000:  # Too small to be timestamp, probably missing
-                # Insert placeholder timestamp (will be estimated later)
-                return f"0,{','.join(columns)}"
-            else:
-                # First is timestamp, missing last column (heater state)
-                return f"{','.join(columns)},UNKNOWN"
-        except ValueError:
+        if not INT_RE.fullmatch(columns[0]):
             # First column is not a number, missing timestamp
             return f"0,{','.join(columns)}"
+        elif int(columns[0]) < 1000:  # Too small to be timestamp, probably missing
+            # Insert placeholder timestamp (will be estimated later)
+            return f"0,{','.join(columns)}"
+        else:
+            # First is timestamp, missing last column (heater state)
+            return f"{','.join(columns)},UNKNOWN"
     elif len(columns) == 3:
         # Missing timestamp and one other column
         # Try to identify what's missing by data type
-        try:
-            # Check if first is time_s (small number < 10000)
-            first_val = float(columns[0])
-            if first_val < 10000:
-                # Missing timestamp, has time_s, current, temp - missing heater
-                return f"0,{','.join(columns)},UNKNOWN"
-            else:
-                # First might be timestamp, missing time_s and heater
-                return f"{columns[0]},0,{columns[1]},{columns[2]},UNKNOWN"
-        except ValueError:
+        if not FLOAT_RE.fullmatch(columns[0]):
             return f"0,0,{','.join(columns)},UNKNOWN"
+        # Check if first is time_s (small number < 10000)
+        elif float(columns[0]) < 10000:
+            # Missing timestamp, has time_s, current, temp - missing heater
+            return f"0,{','.join(columns)},UNKNOWN"
+        else:
+            # First might be timestamp, missing time_s and heater
+            return f"{columns[0]},0,{columns[1]},{columns[2]},UNKNOWN"
     elif len(columns) > 5:
         # Too many columns - might have extra commas in data
         # Try to merge last columns if they look like they should be together
         if len(columns) == 6:
             # Might be: timestamp, time_s, current, temp_part1, temp_part2, heater
             # Or: timestamp, time_s, current, temp, heater_part1, heater_part2
-            try:
-                # Try to combine columns 3 and 4 if column 4 is a small number
-                float(columns[3])
-                float(columns[4])
+            # Try to combine columns 3 and 4 if column 4 is a small number
+            if FLOAT_RE.fullmatch(columns[3]) and FLOAT_RE.fullmatch(columns[4]):
                 # Both are numbers, probably temp got split
                 return f"{columns[0]},{columns[1]},{columns[2]},{columns[3]}.{columns[4]},{columns[5]}"
-            except ValueError:
+            else:
                 # Not numbers, return first 5
                 return ','.join(columns[:5])
         else:
@@ -147,6 +177,18 @@ def fix_csv_line(line, columns):
         # Too few columns, can't fix reliably
         return None
 
+def save_partial_capture(csv_file, lines_captured, csv_filename):
+    """Get a capture cut short (Ctrl+C, unplugged ESP32) onto disk before the exit prompt"""
+    try:
+        csv_file.flush()
+        os.fsync(csv_file.fileno())
+        csv_file.close()
+    except OSError as e:
+        print(f"❌ Error saving partial capture: {e}")
+        return
+    print(f"⚠ Warning: The capture was interrupted before [CSV_END] marker.")
+    print(f"   The {lines_captured:,} lines received so far are in: {csv_filename}")
+
 def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='ESP32 CSV Auto-Capture Tool')
@@ -173,7 +215,7 @@ def main():
     print("\nAvailable ports:")
     for i, port in enumerate(ports):
         # Highlight potential ESP32 ports
-        is_esp32 = any(keyword in port.description.upper() for keyword in ['ESP32', 'CH340', 'CP210', 'FTDI', 'USB', 'SERIAL'])
+        is_esp32 = ESP32_PORT_RE.search(port.description) is not None
         marker = " ⭐" if is_esp32 else ""
         print(f"  {i+1}. {port.device} - {port.description}{marker}")
     
@@ -193,9 +235,9 @@ def main():
         print(f"\n✓ Using command-line specified port: {port_name}")
     else:
         # Auto-detect ESP32
-        esp32_ports = find_esp32_port()
-        if esp32_ports:
-            print(f"\n⚠ Auto-detected potential ESP32 port: {esp32_ports[0]}")
+        esp32_port = find_esp32_port(ports)
+        if esp32_port:
+            print(f"\n⚠ Auto-detected potential ESP32 port: {esp32_port}")
             print("   But please verify this is correct!")
         
         # Ask user to select port
@@ -260,14 +302,15 @@ def main():
     # Wait a moment for user to close other programs
     print("Waiting 3 seconds for you to close Arduino IDE Serial Monitor...")
     for i in range(3, 0, -1):
-        print(f"   {i}...", end='\r')
+        print(f"   {i}...", end='\r', flush=True)
         time.sleep(1)
-    print("   Connecting now...\n")
+    print("   Connecting now...\n", flush=True)
     
     try:
         # Try to open the port with a timeout
         try:
-            ser = serial.Serial(port_name, baud_rate, timeout=2)
+            # Short read timeout: read() blocks until data arrives or this elapses
+            ser = serial.Serial(port_name, baud_rate, timeout=0.05)
         except serial.SerialException as port_error:
             print("=" * 70)
             print("❌ CANNOT ACCESS SERIAL PORT!")
@@ -308,6 +351,9 @@ def main():
             return
         
         # Increase buffer size for large files
+        if sys.platform == "win32":
+            # The driver's default 4 KiB RX ring can overrun during a dump burst
+            ser.set_buffer_size(rx_size=1 << 20, tx_size=1 << 16)
         ser.reset_input_buffer()  # Clear any existing data
         time.sleep(2)  # Wait for connection to stabilize
         print("✓ Connected successfully!\n")
@@ -318,13 +364,16 @@ def main():
         print("💡 Or wait for CSV data markers [CSV_START] and [CSV_END]")
         print("💡 Press Ctrl+C to stop\n")
         
-        csv_data = []
+        csv_file = None  # Open output file while a capture is in progress
+        malformed_count = 0
+        rx_buffer = bytearray()  # Bytes after the last complete line
         capturing = False
-        last_data_time = time.time()
+        last_data_time = time.monotonic()
+        last_status_time = 0.0
         lines_captured = 0
         
         # Optionally send 'dump' command automatically after a delay
-        print("⏳ Waiting 3 seconds, then sending 'dump' command automatically...")
+        print("⏳ Waiting 3 seconds, then sending 'dump' command automatically...", flush=True)
         time.sleep(3)
         ser.write(b'dump\n')
         ser.flush()  # Ensure command is sent
@@ -337,29 +386,52 @@ def main():
         no_data_timeout = 5  # Wait 5 seconds after last data before finalizing
         
         while True:
-            # Read all available data
-            if ser.in_waiting > 0:
+            # Console output is block-buffered: show what the last pass printed
+            # (print rather than sys.stdout.flush(), which fails when there is no console)
+            print(end='', flush=True)
+            
+            # Block in the driver until data arrives (or the read timeout elapses)
+            raw_data = ser.read(65536)
+            if raw_data:
                 try:
-                    # Read in larger chunks for better performance
-                    raw_data = ser.read(ser.in_waiting)
-                    text = raw_data.decode('utf-8', errors='ignore')
+                    # Split off complete lines; keep a partial tail until the rest arrives
+                    rx_buffer += raw_data
+                    *raw_lines, tail = rx_buffer.split(b'\n')
+                    rx_buffer = bytearray(tail)
                     
                     # Process line by line
-                    for line in text.splitlines():
-                        line = line.strip()
+                    for raw_line in raw_lines:
+                        line = raw_line.decode('utf-8', errors='ignore').strip()
                         if not line:
                             continue
                         
-                        # Print to console for monitoring (limit output for large files)
-                        if lines_captured < 50 or lines_captured % 100 == 0:
+                        # Print to console for monitoring; while capturing, only refresh
+                        # a single status line (at most 10x/s) so the console can't stall reads
+                        if capturing:
+                            now = time.monotonic()
+                            if now - last_status_time >= 0.1:
+                                print(f"\r📥 Captured {lines_captured:,} lines...", end='', flush=True)
+                                last_status_time = now
+                        else:
                             print(f"📥 Line {lines_captured + 1}: {line[:80]}..." if len(line) > 80 else f"📥 Line {lines_captured + 1}: {line}")
                         
                         # Check for CSV start marker
                         if "[CSV_START]" in line:
+                            # Rows go straight to disk as they arrive
+                            if csv_file is not None:
+                                csv_file.close()
+                                csv_file = None
+                            try:
+                                csv_file = open(csv_filename, 'w', buffering=1 << 20, newline='', encoding='utf-8')
+                            except OSError as e:
+                                capturing = False
+                                print(f"\n❌ Cannot open output file: {e}")
+                                print("   This capture will not be saved.\n")
+                                continue
                             capturing = True
-                            csv_data = []
                             csv_end_received = False
                             lines_captured = 0
+                            malformed_count = 0
                             print("\n🎯 CSV capture started!\n")
                             continue
                         
@@ -367,8 +439,8 @@ def main():
                         if "[CSV_END]" in line:
                             csv_end_received = True
                             capturing = False
-                            print(f"\n✅ CSV end marker received! (Captured {len(csv_data)} lines)")
-                            print("⏳ Waiting 3 seconds to ensure all data is received...\n")
+                            print(f"\n✅ CSV end marker received! (Captured {lines_captured} lines)")
+                            print("⏳ Waiting 3 seconds to ensure all data is received...\n", flush=True)
                             time.sleep(3)  # Wait a bit more for any remaining data
                             # Continue to process below
                         
@@ -380,61 +452,52 @@ def main():
                             # Save actual CSV data (lines with commas)
                             if ',' in line:
                                 # Validate CSV line has correct number of columns (5: timestamp, time_s, current, temp, heater)
-                                columns = line.split(',')
-                                
                                 # Check if line has proper structure
-                                if len(columns) >= 4:  # At least 4 columns (timestamp might be missing)
-                                    # Try to fix common issues
-                                    fixed_line = fix_csv_line(line, columns)
+                                if line.count(',') >= 3:  # At least 4 columns (timestamp might be missing)
+                                    if CLEAN_ROW_RE.fullmatch(line):
+                                        # Clean row (the vast majority), nothing to fix
+                                        fixed_line = line
+                                    else:
+                                        # Try to fix common issues
+                                        columns = [col.strip() for col in line.split(',') if col.strip()]
+                                        fixed_line = fix_csv_line(line, columns)
+                                        # Only repaired rows can end up with the wrong column count
+                                        if fixed_line and fixed_line.count(',') != 4:
+                                            malformed_count += 1
                                     if fixed_line:
-                                        csv_data.append(fixed_line)
+                                        csv_file.write(fixed_line + '\n')
                                         lines_captured += 1
-                                        last_data_time = time.time()
+                                        last_data_time = time.monotonic()
                                     else:
                                         # Skip malformed lines
                                         if lines_captured < 10 or lines_captured % 500 == 0:
-                                            print(f"⚠ Skipping malformed line: {line[:60]}...")
+                                            print(f"\n⚠ Skipping malformed line: {line[:60]}...")
                                 else:
                                     # Line has too few columns, skip it
                                     if lines_captured < 10 or lines_captured % 500 == 0:
-                                        print(f"⚠ Skipping incomplete line (only {len(columns)} columns): {line[:60]}...")
+                                        print(f"\n⚠ Skipping incomplete line (only {line.count(',') + 1} columns): {line[:60]}...")
                     
                     # If we received CSV_END, process and save
                     if csv_end_received and not capturing:
-                        print(f"\n📊 Finalizing capture... (Total: {len(csv_data)} lines)")
+                        print(f"\n📊 Finalizing capture... (Total: {lines_captured} lines)")
                         
                         # Save CSV file
-                        if csv_data:
+                        if csv_file is not None and lines_captured:
                             try:
                                 print("💾 Saving to file...")
-                                with open(csv_filename, 'w', newline='', encoding='utf-8') as f:
-                                    for csv_line in csv_data:
-                                        f.write(csv_line + '\n')
+                                # Rows are already written; make sure they reach the disk
+                                csv_file.flush()
+                                os.fsync(csv_file.fileno())
+                                csv_file.close()
                                 
                                 file_size = os.path.getsize(csv_filename)
                                 print("=" * 70)
                                 print(f"✅ CSV file saved successfully!")
                                 print(f"📁 Location: {csv_filename}")
                                 print(f"📊 Size: {file_size:,} bytes")
-                                print(f"📝 Lines: {len(csv_data):,}")
+                                print(f"📝 Lines: {lines_captured:,}")
                                 print("=" * 70)
                                 
-                                # Verify file was written correctly
-                                with open(csv_filename, 'r', encoding='utf-8') as f:
-                                    verify_lines = sum(1 for _ in f)
-                                    # Also check for malformed lines
-                                    f.seek(0)
-                                    malformed_count = 0
-                                    for verify_line in f:
-                                        cols = verify_line.strip().split(',')
-                                        if len(cols) != 5:
-                                            malformed_count += 1
-                                
-                                print(f"✓ Verified: {verify_lines:,} lines in file")
-                                
-                                if verify_lines != len(csv_data):
-                                    print(f"⚠ Warning: File has {verify_lines} lines but captured {len(csv_data)} lines")
-                                
                                 if malformed_count > 0:
                                     print(f"⚠ Warning: {malformed_count} lines have incorrect column count (may need manual fixing)")
                                 else:
@@ -445,16 +508,25 @@ def main():
                                 print("   2. Press Ctrl+C to exit")
                                 print()
                                 
-                                # Clear data for next capture
-                                csv_data = []
+                                # Reset for next capture
                                 csv_end_received = False
                                 capturing = False
                             except Exception as e:
-                                print(f"❌ Error saving file: {e}")
+                                print(f"❌ Error saving file: {e}", flush=True)
                                 import traceback
                                 traceback.print_exc()
+                                # Don't leak the handle; the error above is the one that matters
+                                try:
+                                    csv_file.close()
+                                except OSError:
+                                    pass
                         else:
+                            if csv_file is not None:
+                                # Don't leave an empty file behind
+                                csv_file.close()
+                                os.remove(csv_filename)
                             print("⚠ No CSV data captured!")
+                        csv_file = None
                         csv_end_received = False  # Reset for next capture
                         
                 except UnicodeDecodeError:
@@ -465,20 +537,20 @@ def main():
                 # No data available
                 if capturing and not csv_end_received:
                     # Check if we've been waiting too long (might indicate connection issue)
-                    if time.time() - last_data_time > 30:  # 30 seconds without data
+                    if time.monotonic() - last_data_time > 30:  # 30 seconds without data
                         print(f"\n⚠ Warning: No data received for 30 seconds!")
-                        print(f"   Captured {len(csv_data)} lines so far...")
+                        print(f"   Captured {lines_captured} lines so far...")
                         print("   Waiting for more data or [CSV_END] marker...")
-                        last_data_time = time.time()  # Reset timer
-            
-            # Small delay to prevent CPU spinning
-            time.sleep(0.01)
+                        last_data_time = time.monotonic()  # Reset timer
                 
     except serial.SerialException as e:
         print("=" * 70)
         print("❌ SERIAL PORT ERROR!")
         print("=" * 70)
         print(f"\nError: {e}")
+        if 'csv_file' in locals() and csv_file is not None and not csv_file.closed:
+            print()
+            save_partial_capture(csv_file, lines_captured, csv_filename)
         print("\n🔧 QUICK FIX:")
         print("1. Close Arduino IDE Serial Monitor completely")
         print("2. Wait 2-3 seconds")
@@ -487,19 +559,27 @@ def main():
         input("\nPress Enter to exit...")
     except KeyboardInterrupt:
         print(f"\n\n👋 Script stopped.")
-        if csv_data:
-            print(f"⚠ Warning: {len(csv_data)} lines were captured but not saved.")
-            print("   The capture was interrupted before [CSV_END] marker.")
+        if 'csv_file' in locals() and csv_file is not None and not csv_file.closed:
+            save_partial_capture(csv_file, lines_captured, csv_filename)
         input("Press Enter to exit...")
     except Exception as e:
         print(f"❌ Error: {e}")
         input("\nPress Enter to exit...")
     finally:
+        if 'csv_file' in locals() and csv_file is not None and not csv_file.closed:
+            csv_file.close()
         if 'ser' in locals() and ser.is_open:
             ser.close()
             print("✓ Serial port closed")
 
 if __name__ == "__main__":
+    # Block-buffer console output (64 KiB) instead of flushing on every line;
+    # main() flushes explicitly before it waits on the user or the port
+    try:
+        sys.stdout.flush()
+        sys.stdout = open(sys.stdout.fileno(), 'w', buffering=1 << 16, encoding='utf-8', closefd=False)
+    except (AttributeError, OSError, ValueError):
+        pass  # No real console (IDLE, pythonw); keep the original stream
     try:
         main()
     except KeyboardInterrupt: